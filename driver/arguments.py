@@ -45,9 +45,18 @@ suffixes s, m, h and K, M, G.
 By default, all limits are inactive. Only external limits (e.g. set with
 ulimit) are respected.
 
+The time already used by the driver is measured as wall-clock time and is
+subtracted from the overall and external limits. On a loaded machine this
+leaves less time to later components than measuring CPU time would. Set the
+environment variable FD_USE_CPU_TIME to measure CPU time instead (not
+available on Windows). Under Python 2, CPU time is always used.
+
 Portfolios require that a time limit is in effect. Portfolio configurations
 that exceed their time or memory limit are aborted, and the next
-configuration is run."""
+configuration is run. Optimal portfolios that set ALLOW_PARALLEL = True run
+their configurations concurrently, one per available CPU, and stop all of
+them as soon as one finds a plan or proves the task unsolvable. The memory
+limit is then split evenly between the concurrent configurations."""
 
 EXAMPLE_PORTFOLIO = os.path.relpath(
     aliases.PORTFOLIOS["seq-opt-fdss-1"], start=util.REPO_ROOT_DIR)
@@ -6,25 +6,87 @@ from __future__ import print_function
 
 from . import limits
 
+import os
 import subprocess
 import sys
 
 
-def check_call(cmd, stdin=None, time_limit=None, memory_limit=None):
+def start_process(cmd, stdin=None, time_limit=None, memory_limit=None):
+    """Start *cmd* with the given limits and return the Popen object.
+
+    *stdin* is either the name of the file to read from or a file
+    descriptor that is shared between calls and rewound for each one.
+
+    If possible, the limits are set from the parent process right after
+    the child has been spawned. Without a preexec_fn, subprocess can use
+    vfork/posix_spawn instead of a full fork of the Python process. The
+    limits are still computed and printed before the child starts, so
+    they appear before any output of the child.
+    """
     def set_limits():
         limits.set_time_limit(time_limit)
         limits.set_memory_limit(memory_limit)
 
     kwargs = {}
+    set_limits_after_start = False
     if time_limit is not None or memory_limit is not None:
-        if limits.can_set_limits():
+        if limits.can_set_limits_of_other_processes():
+            set_limits_after_start = True
+            time_limits = limits.get_time_limits(time_limit)
+        elif limits.can_set_limits():
             kwargs["preexec_fn"] = set_limits
         else:
             sys.exit(limits.RESOURCE_MODULE_MISSING_MSG)
 
-    sys.stdout.flush()
-    if stdin:
+    if isinstance(stdin, int):
+        os.lseek(stdin, 0, os.SEEK_SET)
+        process = subprocess.Popen(cmd, stdin=stdin, **kwargs)
+    elif stdin:
         with open(stdin) as stdin_file:
-            return subprocess.check_call(cmd, stdin=stdin_file, **kwargs)
+            process = subprocess.Popen(cmd, stdin=stdin_file, **kwargs)
     else:
-        return subprocess.check_call(cmd, **kwargs)
+        process = subprocess.Popen(cmd, **kwargs)
+    if set_limits_after_start:
+        limits.set_time_limits(time_limits, pid=process.pid)
+        limits.set_memory_limit(memory_limit, pid=process.pid)
+    return process
+
+
+def can_wait_with_timeout():
+    """Popen.wait() only supports timeouts in Python >= 3.3."""
+    return hasattr(subprocess, "TimeoutExpired")
+
+
+def wait_with_timeout(process, timeout, grace_period):
+    """Wait for *process* and return a pair (returncode, terminated).
+
+    If the process is still running after *timeout* seconds of
+    wall-clock time, send it SIGTERM, and SIGKILL if it is still alive
+    *grace_period* seconds later. *terminated* tells whether this
+    happened. Without timeouts for Popen.wait() (Python < 3.3), just
+    wait and rely on the CPU limit of the process.
+    """
+    if not can_wait_with_timeout():
+        return process.wait(), False
+    try:
+        return process.wait(timeout=timeout), False
+    except subprocess.TimeoutExpired:
+        pass
+    print("Time limit of %.2fs reached. Terminating process." % timeout)
+    process.terminate()
+    try:
+        return process.wait(timeout=grace_period), True
+    except subprocess.TimeoutExpired:
+        pass
+    print("Process did not terminate within %ds. Killing it." % grace_period)
+    process.kill()
+    return process.wait(), True
+
+
+def check_call(cmd, stdin=None, time_limit=None, memory_limit=None):
+    process = start_process(
+        cmd, stdin=stdin, time_limit=time_limit, memory_limit=memory_limit)
+    returncode = process.wait()
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return 0
@@ -23,51 +23,83 @@ def can_set_limits():
     return resource is not None
 
 
-def _set_limit(kind, soft, hard=None):
+def can_set_limits_of_other_processes():
+    """resource.prlimit() is only available on Linux with Python >= 3.4."""
+    return can_set_limits() and hasattr(resource, "prlimit")
+
+
+def _set_limit(kind, soft, hard=None, pid=None):
     if hard is None:
         hard = soft
     try:
-        resource.setrlimit(kind, (soft, hard))
+        if pid is None:
+            resource.setrlimit(kind, (soft, hard))
+        else:
+            resource.prlimit(pid, kind, (soft, hard))
     except (OSError, ValueError) as err:
         print(
             "Limit for {} could not be set to ({},{}) ({}). "
             "Previous limit: {}".format(
-                kind, soft, hard, err, resource.getrlimit(kind)),
+                kind, soft, hard, err, _get_limit(kind, pid)),
             file=sys.stderr)
 
 
+def _get_limit(kind, pid=None):
+    if pid is None:
+        return resource.getrlimit(kind)
+    try:
+        return resource.prlimit(pid, kind)
+    except OSError:
+        # The process has already terminated.
+        return None
+
+
 def _get_soft_and_hard_time_limits(internal_limit, external_hard_limit):
     soft_limit = min(int(math.ceil(internal_limit)), external_hard_limit)
     hard_limit = min(soft_limit + 1, external_hard_limit)
     print("time limit %.2f -> (%d, %d)" %
         (internal_limit, soft_limit, hard_limit))
-    sys.stdout.flush()
     assert soft_limit <= hard_limit
     return soft_limit, hard_limit
 
 
-def set_time_limit(time_limit):
+def get_time_limits(time_limit):
+    """Return the (soft, hard) CPU limits that enforce *time_limit* or
+    None if *time_limit* is None."""
     if time_limit is None:
-        return
+        return None
     assert can_set_limits()
     # Don't try to raise the hard limit.
     _, external_hard_limit = resource.getrlimit(resource.RLIMIT_CPU)
     if external_hard_limit == resource.RLIM_INFINITY:
         external_hard_limit = float("inf")
     assert time_limit <= external_hard_limit, (time_limit, external_hard_limit)
+    return _get_soft_and_hard_time_limits(time_limit, external_hard_limit)
+
+
+def set_time_limits(time_limits, pid=None):
+    """Set CPU limits computed by get_time_limits() for process *pid*
+    (default: this process)."""
+    if time_limits is None:
+        return
     # Soft limit reached --> SIGXCPU.
     # Hard limit reached --> SIGKILL.
-    soft_limit, hard_limit = _get_soft_and_hard_time_limits(
-        time_limit, external_hard_limit)
-    _set_limit(resource.RLIMIT_CPU, soft_limit, hard_limit)
+    soft_limit, hard_limit = time_limits
+    _set_limit(resource.RLIMIT_CPU, soft_limit, hard_limit, pid=pid)
+
+
+def set_time_limit(time_limit):
+    set_time_limits(get_time_limits(time_limit))
+
 
+def set_memory_limit(memory, pid=None):
+    """Limit the address space of process *pid* (default: this process).
 
-def set_memory_limit(memory):
-    """*memory* must be given in bytes or None."""
+    *memory* must be given in bytes or None."""
     if memory is None:
         return
     assert can_set_limits()
-    _set_limit(resource.RLIMIT_AS, memory)
+    _set_limit(resource.RLIMIT_AS, memory, pid=pid)
 
 
 def convert_to_mb(num_bytes):
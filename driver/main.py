@@ -2,6 +2,7 @@
 from __future__ import print_function
 
 import logging
+import os
 import subprocess
 import sys
 
@@ -11,7 +12,20 @@ from . import cleanup
 from . import run_components
 
 
+def make_stdout_line_buffered():
+    """Flush stdout after every line. Together with the planner
+    components, which write to the same file descriptor, this keeps the
+    output in order without explicit flushes before each call."""
+    sys.stdout.flush()
+    try:
+        sys.stdout.reconfigure(line_buffering=True)
+    except AttributeError:
+        # Python < 3.7.
+        sys.stdout = os.fdopen(sys.stdout.fileno(), "w", 1)
+
+
 def main():
+    make_stdout_line_buffered()
     args = arguments.parse_args()
     logging.basicConfig(level=getattr(logging, args.log_level.upper()),
                         format="%(levelname)-8s %(message)s",
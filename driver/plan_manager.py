@@ -3,6 +3,7 @@
 from __future__ import print_function
 
 import itertools
+import mmap
 import os
 import os.path
 import re
@@ -12,11 +13,24 @@ _PLAN_INFO_REGEX = re.compile(r"; cost = (\d+) \((unit cost|general cost)\)\n")
 
 
 def _read_last_line(filename):
-    line = None
-    with open(filename) as input_file:
-        for line in input_file:
-            pass
-    return line
+    """Return the last line of the given file or None if it is empty.
+
+    The file is memory-mapped, so only its tail needs to be read."""
+    with open(filename, "rb") as input_file:
+        try:
+            contents = mmap.mmap(
+                input_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped.
+            return None
+        try:
+            end = len(contents)
+            start = contents.rfind(b"\n", 0, end - 1) + 1
+            line = contents[start:end].decode("utf-8")
+        finally:
+            contents.close()
+    # Undo Windows line endings, as reading in text mode would.
+    return line.replace("\r\n", "\n")
 
 
 def _parse_plan(plan_filename):
@@ -92,13 +106,22 @@ class PlanManager(object):
                 self._plan_costs.append(cost)
 
     def get_existing_plans(self):
-        """Yield all plans that match the given plan prefix."""
-        if os.path.exists(self._plan_prefix):
+        """Yield all plans that match the given plan prefix.
+
+        The plan directory is listed once instead of probing every
+        candidate plan file with a separate system call."""
+        plan_dir, plan_basename = os.path.split(self._plan_prefix)
+        try:
+            filenames = set(os.listdir(plan_dir or os.curdir))
+        except OSError:
+            return
+
+        if plan_basename in filenames:
             yield self._plan_prefix
 
         for counter in itertools.count(start=1):
             plan_filename = self._get_plan_file(counter)
-            if os.path.exists(plan_filename):
+            if os.path.basename(plan_filename) in filenames:
                 yield plan_filename
             else:
                 break
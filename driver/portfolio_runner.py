@@ -5,7 +5,9 @@ from __future__ import print_function
 """ Module for running planner portfolios.
 
 Memory limits: We apply the same memory limit that is given to the
-plan script to each planner call. Note that this setup does not work if
+plan script to each planner call. Portfolios that run their configs in
+parallel (ALLOW_PARALLEL) split this limit evenly between the
+concurrent planner calls instead. Note that this setup does not work if
 the sum of the memory usage of the Python process and the planner calls
 is limited. In this case the Python process might get killed although
 we would like to kill only the single planner call and continue with
@@ -19,18 +21,31 @@ the process is started.
 
 __all__ = ["run"]
 
+import multiprocessing
 import os
+try:
+    import queue
+except ImportError:
+    import Queue as queue
 import subprocess
 import sys
+import threading
 import traceback
 
 from . import call
 from . import limits
 from . import returncodes
 from . import util
+from .plan_manager import PlanManager
 
 
 DEFAULT_TIMEOUT = 1800
+# Planner calls that exceed their time limit get a SIGTERM first. Only
+# if they are still running this many seconds later, they are killed.
+# The CPU time limit is raised by the same amount and serves as backstop.
+# Without timeouts for Popen.wait() (Python 2) or when time is measured
+# as CPU time (FD_USE_CPU_TIME), only the unchanged CPU time limit applies.
+GRACE_PERIOD = 2
 
 
 def adapt_args(args, search_cost_type, heuristic_cost_type, plan_manager):
@@ -60,27 +75,62 @@ def adapt_args(args, search_cost_type, heuristic_cost_type, plan_manager):
             break
 
 
-def run_search(executable, args, sas_file, plan_manager, time, memory):
-    complete_args = [executable] + args + [
-        "--internal-plan-file", plan_manager.get_plan_prefix()]
+def _use_sigterm_guard():
+    # The guard counts wall-clock time, so it cannot enforce the CPU time
+    # budgets handed out when util.get_elapsed_time() measures CPU time.
+    return call.can_wait_with_timeout() and not util.uses_cpu_time()
+
+
+def start_search(executable, args, sas_file, plan_manager, time, memory):
+    complete_args = [executable]
+    complete_args += args
+    complete_args += ["--internal-plan-file", plan_manager.get_plan_prefix()]
     print("args: %s" % complete_args)
+    cpu_time_limit = time
+    if _use_sigterm_guard():
+        # The CPU limit is only the backstop for the SIGTERM guard in
+        # wait_for_search(). Never exceed the external CPU limit with it.
+        cpu_time_limit = limits.get_time_limit(time + GRACE_PERIOD, None)
+    return call.start_process(
+        complete_args, stdin=sas_file, time_limit=cpu_time_limit,
+        memory_limit=memory)
+
+
+def wait_for_search(process, time):
+    if not _use_sigterm_guard():
+        return process.wait()
+    exitcode, terminated = call.wait_with_timeout(process, time, GRACE_PERIOD)
+    if terminated and exitcode < 0:
+        # The planner died from our SIGTERM/SIGKILL (or from SIGXCPU
+        # during the grace period), so it ran out of time.
+        exitcode = returncodes.EXIT_TIMEOUT
+    return exitcode
 
-    try:
-        exitcode = call.check_call(
-            complete_args, stdin=sas_file,
-            time_limit=time, memory_limit=memory)
-    except subprocess.CalledProcessError as err:
-        exitcode = err.returncode
+
+def run_search(executable, args, sas_file, plan_manager, time, memory):
+    process = start_search(
+        executable, args, sas_file, plan_manager, time, memory)
+    exitcode = wait_for_search(process, time)
     print("exitcode: %d" % exitcode)
     print()
     return exitcode
 
 
-def compute_run_time(timeout, configs, pos):
+def get_remaining_relative_times(configs):
+    """Return a list whose entry at index *pos* is the sum of the
+    relative times of configs[pos:]. The list has a trailing 0."""
+    remaining_relative_times = [0] * (len(configs) + 1)
+    for pos in range(len(configs) - 1, -1, -1):
+        remaining_relative_times[pos] = (
+            remaining_relative_times[pos + 1] + configs[pos][0])
+    return remaining_relative_times
+
+
+def compute_run_time(timeout, configs, remaining_relative_times, pos):
     remaining_time = timeout - util.get_elapsed_time()
     print("remaining time: {}".format(remaining_time))
     relative_time = configs[pos][0]
-    remaining_relative_time = sum(config[0] for config in configs[pos:])
+    remaining_relative_time = remaining_relative_times[pos]
     print("config {}: relative time {}, remaining {}".format(
           pos, relative_time, remaining_relative_time))
     # For the last config we have relative_time == remaining_relative_time, so
@@ -88,9 +138,10 @@ def compute_run_time(timeout, configs, pos):
     return remaining_time * relative_time / remaining_relative_time
 
 
-def run_sat_config(configs, pos, search_cost_type, heuristic_cost_type,
-                   executable, sas_file, plan_manager, timeout, memory):
-    run_time = compute_run_time(timeout, configs, pos)
+def run_sat_config(configs, remaining_relative_times, pos, search_cost_type,
+                   heuristic_cost_type, executable, sas_file, plan_manager,
+                   timeout, memory):
+    run_time = compute_run_time(timeout, configs, remaining_relative_times, pos)
     if run_time <= 0:
         return None
     _, args_template = configs[pos]
@@ -113,10 +164,12 @@ def run_sat(configs, executable, sas_file, plan_manager, final_config,
     changed_cost_types = False
     while configs:
         configs_next_round = []
+        remaining_relative_times = get_remaining_relative_times(configs)
         for pos, (relative_time, args) in enumerate(configs):
             exitcode = run_sat_config(
-                configs, pos, search_cost_type, heuristic_cost_type,
-                executable, sas_file, plan_manager, timeout, memory)
+                configs, remaining_relative_times, pos, search_cost_type,
+                heuristic_cost_type, executable, sas_file, plan_manager,
+                timeout, memory)
             if exitcode is None:
                 return
 
@@ -133,8 +186,9 @@ def run_sat(configs, executable, sas_file, plan_manager, final_config,
                     search_cost_type = "normal"
                     heuristic_cost_type = "plusone"
                     exitcode = run_sat_config(
-                        configs, pos, search_cost_type, heuristic_cost_type,
-                        executable, sas_file, plan_manager, timeout, memory)
+                        configs, remaining_relative_times, pos,
+                        search_cost_type, heuristic_cost_type, executable,
+                        sas_file, plan_manager, timeout, memory)
                     if exitcode is None:
                         return
 
@@ -155,7 +209,7 @@ def run_sat(configs, executable, sas_file, plan_manager, final_config,
     if final_config:
         print("Abort portfolio and run final config.")
         exitcode = run_sat_config(
-            [(1, final_config)], 0, search_cost_type,
+            [(1, final_config)], [1, 0], 0, search_cost_type,
             heuristic_cost_type, executable, sas_file, plan_manager,
             timeout, memory)
         if exitcode is not None:
@@ -163,8 +217,10 @@ def run_sat(configs, executable, sas_file, plan_manager, final_config,
 
 
 def run_opt(configs, executable, sas_file, plan_manager, timeout, memory):
+    remaining_relative_times = get_remaining_relative_times(configs)
     for pos, (relative_time, args) in enumerate(configs):
-        run_time = compute_run_time(timeout, configs, pos)
+        run_time = compute_run_time(
+            timeout, configs, remaining_relative_times, pos)
         exitcode = run_search(executable, args, sas_file, plan_manager,
                               run_time, memory)
         yield exitcode
@@ -173,22 +229,127 @@ def run_opt(configs, executable, sas_file, plan_manager, timeout, memory):
             break
 
 
+def _get_cpu_count():
+    """Return the number of CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        # Respects the affinity mask and cgroup cpusets.
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+def _move_plans(source_manager, target_manager):
+    for plan_filename in source_manager.get_existing_plans():
+        suffix = plan_filename[len(source_manager.get_plan_prefix()):]
+        os.rename(plan_filename, target_manager.get_plan_prefix() + suffix)
+
+
+def run_opt_parallel(configs, executable, sas_file, plan_manager, timeout,
+                     memory):
+    """
+    Run the configs concurrently, using at most one process per CPU.
+
+    Each config gets its share of the remaining time up front and the
+    memory limit is split evenly between the concurrent runs. Every run
+    writes its plan to a separate file. As soon as one config finds a
+    plan or proves the task unsolvable, the remaining runs are killed
+    and their exit codes are discarded. Only the plan of the winning
+    config is kept under the regular plan file name.
+    """
+    remaining_time = timeout - util.get_elapsed_time()
+    remaining_relative_time = get_remaining_relative_times(configs)[0]
+    num_jobs = min(len(configs), _get_cpu_count())
+    print("remaining time: {}".format(remaining_time))
+    print("running up to {} configs in parallel".format(num_jobs))
+    if memory is not None:
+        memory //= num_jobs
+        print("memory limit per config: {} MB".format(
+            int(limits.convert_to_mb(memory))))
+    pending = list(enumerate(configs))
+    running = {}
+    config_plan_managers = {}
+    winner = None
+    finished = queue.Queue()
+
+    def wait_for_process(pos, process, run_time):
+        finished.put((pos, wait_for_search(process, run_time)))
+
+    try:
+        while pending or running:
+            while pending and len(running) < num_jobs:
+                pos, (relative_time, args) = pending.pop(0)
+                print("config {}: relative time {}, remaining {}".format(
+                      pos, relative_time, remaining_relative_time))
+                run_time = (
+                    remaining_time * relative_time / remaining_relative_time)
+                config_plan_manager = PlanManager(
+                    "{}.config{}".format(plan_manager.get_plan_prefix(), pos))
+                config_plan_managers[pos] = config_plan_manager
+                process = start_search(
+                    executable, args, sas_file, config_plan_manager,
+                    run_time, memory)
+                running[pos] = process
+                waiter = threading.Thread(
+                    target=wait_for_process, args=(pos, process, run_time))
+                waiter.daemon = True
+                waiter.start()
+
+            pos, exitcode = finished.get()
+            del running[pos]
+            print("config {} exitcode: {}".format(pos, exitcode))
+            print()
+            yield exitcode
+
+            if exitcode in [returncodes.EXIT_PLAN_FOUND, returncodes.EXIT_UNSOLVABLE]:
+                winner = pos
+                break
+    finally:
+        for pos, process in running.items():
+            print("Kill config {}.".format(pos))
+            try:
+                process.kill()
+            except OSError:
+                # The process has already terminated.
+                pass
+        for _ in range(len(running)):
+            finished.get()
+        # All runs have terminated, so no plan file can change any more.
+        for pos, config_plan_manager in config_plan_managers.items():
+            if pos == winner:
+                _move_plans(config_plan_manager, plan_manager)
+            else:
+                config_plan_manager.delete_existing_plans()
+
+
 def can_change_cost_type(args):
     return any("S_COST_TYPE" in part or "H_COST_TYPE" in part for part in args)
 
 
+_PORTFOLIO_CODE_CACHE = {}
+
+
 def get_portfolio_attributes(portfolio):
     attributes = {}
-    with open(portfolio) as portfolio_file:
-        content = portfolio_file.read()
-        try:
-            exec(content, attributes)
-        except Exception:
-            traceback.print_exc()
-            raise ImportError(
-                "The portfolio %s could not be loaded. Maybe it still "
-                "uses the old portfolio syntax? See the FDSS portfolios "
-                "for examples using the new syntax." % portfolio)
+    # Code objects are cached, so a portfolio that is run more than once
+    # from the same process is only parsed again if the file changed.
+    stat = os.stat(portfolio)
+    key = (os.path.abspath(portfolio), stat.st_mtime, stat.st_size)
+    code = _PORTFOLIO_CODE_CACHE.get(key)
+    if code is None:
+        with open(portfolio) as portfolio_file:
+            content = portfolio_file.read()
+    try:
+        if code is None:
+            code = compile(content, portfolio, "exec")
+            _PORTFOLIO_CODE_CACHE[key] = code
+        # Execute in a fresh namespace so that callers never share the
+        # (mutable) CONFIGS of a previous run.
+        exec(code, attributes)
+    except Exception:
+        traceback.print_exc()
+        raise ImportError(
+            "The portfolio %s could not be loaded. Maybe it still "
+            "uses the old portfolio syntax? See the FDSS portfolios "
+            "for examples using the new syntax." % portfolio)
     if "CONFIGS" not in attributes:
         raise ValueError("portfolios must define CONFIGS")
     if "OPTIMAL" not in attributes:
@@ -208,10 +369,15 @@ def run(portfolio, executable, sas_file, plan_manager, time, memory):
     optimal = attributes["OPTIMAL"]
     final_config = attributes.get("FINAL_CONFIG")
     final_config_builder = attributes.get("FINAL_CONFIG_BUILDER")
+    allow_parallel = attributes.get("ALLOW_PARALLEL", False)
     if "TIMEOUT" in attributes:
         sys.exit(
             "The TIMEOUT attribute in portfolios has been removed. "
             "Please pass a time limit to fast-downward.py.")
+    if allow_parallel and not optimal:
+        sys.exit(
+            "The ALLOW_PARALLEL attribute is only supported for optimal "
+            "portfolios.")
 
     if time is None:
         if os.name == "nt":
@@ -223,13 +389,26 @@ def run(portfolio, executable, sas_file, plan_manager, time, memory):
 
     timeout = util.get_elapsed_time() + time
 
-    if optimal:
-        exitcodes = run_opt(
+    if optimal and allow_parallel:
+        # Concurrent calls must not share a file offset, so each of them
+        # opens the task on its own.
+        exitcodes = run_opt_parallel(
             configs, executable, sas_file, plan_manager, timeout, memory)
+        exitcode = returncodes.generate_portfolio_exitcode(exitcodes)
     else:
-        exitcodes = run_sat(
-            configs, executable, sas_file, plan_manager, final_config,
-            final_config_builder, timeout, memory)
-    exitcode = returncodes.generate_portfolio_exitcode(exitcodes)
+        # Open the task once and rewind it for each sequential call.
+        sas_fd = os.open(sas_file, os.O_RDONLY)
+        try:
+            if optimal:
+                exitcodes = run_opt(
+                    configs, executable, sas_fd, plan_manager, timeout,
+                    memory)
+            else:
+                exitcodes = run_sat(
+                    configs, executable, sas_fd, plan_manager,
+                    final_config, final_config_builder, timeout, memory)
+            exitcode = returncodes.generate_portfolio_exitcode(exitcodes)
+        finally:
+            os.close(sas_fd)
     if exitcode != 0:
         raise subprocess.CalledProcessError(exitcode, ["run-portfolio", portfolio])
@@ -20,6 +20,22 @@ EXPECTED_EXITCODES = set([
     EXIT_PLAN_FOUND, EXIT_UNSOLVABLE, EXIT_UNSOLVED_INCOMPLETE,
     EXIT_OUT_OF_MEMORY, EXIT_TIMEOUT, EXIT_SIGXCPU])
 
+# Each expected exit code sets one bit in a mask that summarizes the
+# exit codes of a portfolio. EXIT_SIGXCPU counts as a timeout.
+_BIT_PLAN_FOUND = 1 << 0
+_BIT_UNSOLVABLE = 1 << 1
+_BIT_UNSOLVED_INCOMPLETE = 1 << 2
+_BIT_OUT_OF_MEMORY = 1 << 3
+_BIT_TIMEOUT = 1 << 4
+_EXITCODE_BITS = {
+    EXIT_PLAN_FOUND: _BIT_PLAN_FOUND,
+    EXIT_UNSOLVABLE: _BIT_UNSOLVABLE,
+    EXIT_UNSOLVED_INCOMPLETE: _BIT_UNSOLVED_INCOMPLETE,
+    EXIT_OUT_OF_MEMORY: _BIT_OUT_OF_MEMORY,
+    EXIT_TIMEOUT: _BIT_TIMEOUT,
+    EXIT_SIGXCPU: _BIT_TIMEOUT,
+}
+
 
 def generate_portfolio_exitcode(exitcodes):
     """A portfolio's exitcode is determined as follows:
@@ -33,25 +49,33 @@ def generate_portfolio_exitcode(exitcodes):
     [..., EXIT_TIMEOUT, ...] -> EXIT_TIMEOUT
     [..., EXIT_OUT_OF_MEMORY, ...] -> EXIT_OUT_OF_MEMORY
     """
+    exitcodes = list(exitcodes)
     print("Exit codes: %s" % exitcodes)
-    exitcodes = set(exitcodes)
-    if EXIT_SIGXCPU in exitcodes:
-        exitcodes.remove(EXIT_SIGXCPU)
-        exitcodes.add(EXIT_TIMEOUT)
-    unexpected_codes = exitcodes - EXPECTED_EXITCODES
+    mask = 0
+    unexpected_codes = set()
+    for code in exitcodes:
+        bit = _EXITCODE_BITS.get(code)
+        if bit is None:
+            unexpected_codes.add(code)
+        else:
+            mask |= bit
     if unexpected_codes:
         print("Error: Unexpected exit codes: %s" % list(unexpected_codes))
         if len(unexpected_codes) == 1:
             return unexpected_codes.pop()
         else:
             return EXIT_CRITICAL_ERROR
-    for code in [EXIT_PLAN_FOUND, EXIT_UNSOLVABLE, EXIT_UNSOLVED_INCOMPLETE]:
-        if code in exitcodes:
-            return code
-    for code in [EXIT_OUT_OF_MEMORY, EXIT_TIMEOUT]:
-        if exitcodes == set([code]):
-            return code
-    if exitcodes == set([EXIT_OUT_OF_MEMORY, EXIT_TIMEOUT]):
+    if mask & _BIT_PLAN_FOUND:
+        return EXIT_PLAN_FOUND
+    if mask & _BIT_UNSOLVABLE:
+        return EXIT_UNSOLVABLE
+    if mask & _BIT_UNSOLVED_INCOMPLETE:
+        return EXIT_UNSOLVED_INCOMPLETE
+    if mask == _BIT_OUT_OF_MEMORY:
+        return EXIT_OUT_OF_MEMORY
+    if mask == _BIT_TIMEOUT:
+        return EXIT_TIMEOUT
+    if mask == _BIT_OUT_OF_MEMORY | _BIT_TIMEOUT:
         return EXIT_TIMEOUT_AND_MEMORY
     print("Error: Unhandled exit codes: %s" % exitcodes)
     return EXIT_CRITICAL_ERROR
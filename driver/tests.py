@@ -7,12 +7,24 @@ Test module for Fast Downward driver script. Run with
 """
 
 import os
+import signal
 import subprocess
+import sys
+import textwrap
+import time
+
+import pytest
 
 from .aliases import ALIASES, PORTFOLIOS
 from .arguments import EXAMPLES
+from . import call
 from . import limits
+from . import plan_manager
+from . import portfolio_runner
+from . import returncodes
+from . import util
 from .returncodes import EXIT_PLAN_FOUND, EXIT_UNSOLVED_INCOMPLETE
+from .plan_manager import PlanManager
 from .util import REPO_ROOT_DIR, find_domain_filename
 
 
@@ -67,9 +79,175 @@ def test_time_limits():
             (expected_soft, expected_hard))
 
 
+def test_portfolio_exitcodes():
+    for exitcodes, expected in [
+            ([returncodes.EXIT_TIMEOUT, returncodes.EXIT_PLAN_FOUND],
+             returncodes.EXIT_PLAN_FOUND),
+            ([returncodes.EXIT_UNSOLVED_INCOMPLETE, returncodes.EXIT_UNSOLVABLE],
+             returncodes.EXIT_UNSOLVABLE),
+            ([returncodes.EXIT_TIMEOUT, returncodes.EXIT_UNSOLVED_INCOMPLETE],
+             returncodes.EXIT_UNSOLVED_INCOMPLETE),
+            ([returncodes.EXIT_OUT_OF_MEMORY] * 2,
+             returncodes.EXIT_OUT_OF_MEMORY),
+            ([returncodes.EXIT_SIGXCPU, returncodes.EXIT_TIMEOUT],
+             returncodes.EXIT_TIMEOUT),
+            ([returncodes.EXIT_OUT_OF_MEMORY, returncodes.EXIT_SIGXCPU],
+             returncodes.EXIT_TIMEOUT_AND_MEMORY),
+            ([returncodes.EXIT_PLAN_FOUND, returncodes.EXIT_INPUT_ERROR],
+             returncodes.EXIT_INPUT_ERROR),
+            ([returncodes.EXIT_INPUT_ERROR, returncodes.EXIT_UNSUPPORTED],
+             returncodes.EXIT_CRITICAL_ERROR),
+            ([], returncodes.EXIT_CRITICAL_ERROR),
+            ]:
+        assert (returncodes.generate_portfolio_exitcode(iter(exitcodes)) ==
+            expected)
+
+
+def _start_sleeper(on_sigterm):
+    """Start a process that sleeps for a long time and handles SIGTERM
+    as given by *on_sigterm* ("default" or "ignore")."""
+    code = textwrap.dedent("""
+        import signal, sys, time
+        if sys.argv[1] == "ignore":
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        time.sleep(20)
+        """)
+    return subprocess.Popen([sys.executable, "-c", code, on_sigterm])
+
+
+@pytest.mark.skipif(not call.can_wait_with_timeout(),
+                    reason="Popen.wait() does not support timeouts")
+def test_wait_with_timeout(monkeypatch):
+    process = subprocess.Popen([sys.executable, "-c", "import sys; sys.exit(5)"])
+    assert call.wait_with_timeout(process, 10, 1) == (5, False)
+
+    process = _start_sleeper("default")
+    start = time.time()
+    assert call.wait_with_timeout(process, 1, 10) == (-signal.SIGTERM, True)
+    assert time.time() - start < 5
+
+    process = _start_sleeper("ignore")
+    start = time.time()
+    assert call.wait_with_timeout(process, 1, 1) == (-signal.SIGKILL, True)
+    assert time.time() - start < 5
+
+    # Planners that die from our signals have run out of time.
+    monkeypatch.setattr(portfolio_runner, "GRACE_PERIOD", 1)
+    for on_sigterm in ["default", "ignore"]:
+        process = _start_sleeper(on_sigterm)
+        assert (portfolio_runner.wait_for_search(process, 1) ==
+                returncodes.EXIT_TIMEOUT)
+
+
+def test_no_sigterm_guard_with_cpu_time(monkeypatch):
+    monkeypatch.setattr(util, "uses_cpu_time", lambda: True)
+    time_limits = []
+
+    def start_process(cmd, stdin=None, time_limit=None, memory_limit=None):
+        time_limits.append(time_limit)
+        return subprocess.Popen(
+            [sys.executable, "-c", "import sys, time; time.sleep(2); sys.exit(5)"])
+
+    monkeypatch.setattr(call, "start_process", start_process)
+    process = portfolio_runner.start_search(
+        "planner", [], None, PlanManager("sas_plan"), 1, None)
+    # CPU time budgets are enforced by the CPU limit alone.
+    assert time_limits == [1]
+    assert portfolio_runner.wait_for_search(process, 1) == 5
+
+
+def _write_stub_planner(directory):
+    """Write a fake search executable, called as "stub SECONDS EXITCODE
+    --internal-plan-file PREFIX". After SECONDS, it either writes a
+    complete plan and exits with EXIT_PLAN_FOUND shortly afterwards or
+    truncates the plan file and keeps running for a long time."""
+    stub = os.path.join(directory, "stub_planner.py")
+    with open(stub, "w") as stub_file:
+        stub_file.write("#! %s\n" % sys.executable)
+        stub_file.write(textwrap.dedent("""
+            import sys, time
+            seconds, exitcode, _, plan_file = sys.argv[1:]
+            time.sleep(float(seconds))
+            with open(plan_file, "w") as plan:
+                if int(exitcode) == 0:
+                    plan.write("(%s)\\n; cost = 1 (unit cost)\\n" % seconds)
+                else:
+                    plan.write("(partial")
+            time.sleep(1 if int(exitcode) == 0 else 20)
+            sys.exit(int(exitcode))
+            """))
+    os.chmod(stub, 0o755)
+    return stub
+
+
+def test_parallel_portfolio(tmpdir, monkeypatch):
+    monkeypatch.setattr(portfolio_runner, "_get_cpu_count", lambda: 3)
+    directory = str(tmpdir)
+    stub = _write_stub_planner(directory)
+    sas_file = os.path.join(directory, "output")
+    with open(sas_file, "w") as task:
+        task.write("task")
+    plan_prefix = os.path.join(directory, "sas_plan")
+    configs = [
+        (1, ["1", str(returncodes.EXIT_UNSOLVED_INCOMPLETE)]),
+        (1, ["0.5", str(EXIT_PLAN_FOUND)]),
+        (1, ["20", str(EXIT_PLAN_FOUND)]),
+    ]
+    start = time.time()
+    exitcodes = list(portfolio_runner.run_opt_parallel(
+        configs, stub, sas_file, PlanManager(plan_prefix),
+        util.get_elapsed_time() + 100, None))
+    # The first plan found prunes the other runs, which are killed.
+    assert time.time() - start < 10
+    assert exitcodes == [EXIT_PLAN_FOUND]
+    assert returncodes.generate_portfolio_exitcode(exitcodes) == EXIT_PLAN_FOUND
+    # Only the winner's plan survives, under the regular plan file name.
+    assert sorted(os.listdir(directory)) == ["output", "sas_plan", "stub_planner.py"]
+    with open(plan_prefix) as plan:
+        assert plan.read() == "(0.5)\n; cost = 1 (unit cost)\n"
+
+
 def test_automatic_domain_file_name_computation():
     benchmarks_dir = os.path.join(REPO_ROOT_DIR, "benchmarks")
     for dirpath, dirnames, filenames in os.walk(benchmarks_dir):
         for filename in filenames:
             if "domain" not in filename:
                 assert find_domain_filename(os.path.join(dirpath, filename))
+
+
+def test_get_existing_plans(tmpdir):
+    for filename in ["sas_plan", "sas_plan.1", "sas_plan.2", "sas_plan.4",
+                     "sas_plan.x", "other_plan.3"]:
+        tmpdir.join(filename).write("")
+    prefix = str(tmpdir.join("sas_plan"))
+    # Numbered plans stop at the first gap.
+    assert list(PlanManager(prefix).get_existing_plans()) == [
+        prefix, prefix + ".1", prefix + ".2"]
+
+    tmpdir.join("sas_plan").remove()
+    assert list(PlanManager(prefix).get_existing_plans()) == [
+        prefix + ".1", prefix + ".2"]
+
+    missing_prefix = str(tmpdir.join("missing", "sas_plan"))
+    assert list(PlanManager(missing_prefix).get_existing_plans()) == []
+
+
+def test_read_last_line(tmpdir):
+    for content, expected_line in [
+            (b"", None),
+            (b"(a)\n; cost = 12 (unit cost)\n", "; cost = 12 (unit cost)\n"),
+            (b"(a)\n; cost = 1", "; cost = 1"),
+            (b"\n", "\n"),
+            (b"x", "x"),
+            (b"(a)\r\n; cost = 3 (general cost)\r\n",
+             "; cost = 3 (general cost)\n"),
+            ]:
+        plan_file = tmpdir.join("sas_plan")
+        plan_file.write_binary(content)
+        assert plan_manager._read_last_line(str(plan_file)) == expected_line
+
+    plan_file.write_binary(b"(a)\n; cost = 3 (general cost)\n")
+    assert plan_manager._parse_plan(str(plan_file)) == (3, "general cost")
+    # Incomplete plans have a truncated last line.
+    plan_file.write_binary(b"(a)\n; cost = 3 (gen")
+    assert plan_manager._parse_plan(str(plan_file)) == (None, None)
@@ -2,6 +2,7 @@
 
 import os
 import re
+import time
 
 
 DRIVER_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -9,11 +10,30 @@ REPO_ROOT_DIR = os.path.dirname(DRIVER_DIR)
 BUILDS_DIR = os.path.join(REPO_ROOT_DIR, "builds")
 
 
+# Python 2 has no monotonic clock, so we fall back to CPU time there.
+_USE_CPU_TIME = (
+    bool(os.environ.get("FD_USE_CPU_TIME")) or not hasattr(time, "monotonic"))
+if not _USE_CPU_TIME:
+    _START_TIME = time.monotonic()
+
+
 def get_elapsed_time():
     """
-    Return the CPU time taken by the python process and its child
-    processes.
+    Return the wall-clock time that has passed since the driver started.
+
+    Time limits are derived from this value, including the remainder of
+    external CPU limits (see limits.get_time_limit). As long as the
+    planner components run one after another, the wall-clock time is at
+    least the CPU time used, so these limits are conservative; on loaded
+    hosts they are shorter than necessary. Parallel portfolio runs can
+    use more CPU time than wall-clock time, but they split their budget
+    up front (see portfolio_runner.run_opt_parallel).
+
+    If the environment variable FD_USE_CPU_TIME is set, return the CPU
+    time taken by the python process and its child processes instead.
     """
+    if not _USE_CPU_TIME:
+        return time.monotonic() - _START_TIME
     if os.name == "nt":
         # The child time components of os.times() are 0 on Windows. If
         # we ever end up using this method on Windows, we need to be
@@ -22,6 +42,11 @@ def get_elapsed_time():
     return sum(os.times()[:4])
 
 
+def uses_cpu_time():
+    """Return True if get_elapsed_time() measures CPU time."""
+    return _USE_CPU_TIME
+
+
 def find_domain_filename(task_filename):
     """
     Find domain filename for the given task using automatic naming rules.